@@ -3,51 +3,104 @@ import random
 import shutil
 import base64
 import json
-from flask import Flask, jsonify, request
+import mmap
+from collections import deque
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+from flask import Flask, jsonify, request, send_file, Response, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv
 import platform
 import threading
-from functools import wraps
+from functools import wraps, lru_cache
 import time
 import uuid
 
-current_user = None
 HEARTBEAT_TIMEOUT = 30
 
+
+# =================== Server State ===================
+
+class State:
+    """
+    All mutable server state, guarded by a single RLock so handlers stay
+    correct under the threaded waitress server (e.g. the has_pending
+    increment is not atomic with the membership check that precedes it).
+    Handlers take the lock briefly around state access and release it
+    around slow filesystem or model work.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.current_user = None
+        self.update_stack = deque() # queue of update actions (storing image names)
+            # appended on /update, popped from the right on /undo,
+            # drained from the left (FIFO, O(1)) on /commit
+        self.update_stack_dict = {} # image_name -> target_folder
+            # predictions are not stored, they are recalculated
+        self.pending_set = set() # mirrors update_stack for O(1) membership tests
+            # (``in`` on a deque is a linear scan)
+        self.input_files = deque() # in-memory listing of INPUT_FOLDER, kept in
+            # sync by a watchdog observer so /current_image never has to rescan
+        self.input_observer = None
+        self.folders = {} # folder_name -> {"is_empty": bool, "has_pending": int}
+            # thus => can_delete = is_empty and has_pending == 0
+
+    def reset_actions(self):
+        self.update_stack = deque()
+        self.update_stack_dict = {}
+        self.pending_set = set()
+        self.folders = {}
+
+
+state = State()
+
+
 def require_connection(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
-        global current_user
-        token = request.headers.get("X-User-Token")
-        if current_user is not None and (time.time() - current_user["last_seen"]) > HEARTBEAT_TIMEOUT:
-            current_user = None
-        if current_user is None:
-            if token:
-                return jsonify({"error": "User token expired. Please call /heartbeat to register."}), 403
+        # allow the token as a query parameter so plain <img> tags can load raw images
+        token = request.headers.get("X-User-Token") or request.args.get("token")
+        with state.lock:
+            if state.current_user is not None and (time.time() - state.current_user["last_seen"]) > HEARTBEAT_TIMEOUT:
+                state.current_user = None
+            if state.current_user is None:
+                if token:
+                    return jsonify({"error": "User token expired. Please call /heartbeat to register."}), 403
+                else:
+                    return jsonify({"error": "No user token provided. Please call /heartbeat to register."}), 403
             else:
-                return jsonify({"error": "No user token provided. Please call /heartbeat to register."}), 403
-        else:
-            if token != current_user["token"]:
-                return jsonify({"error": "Another user is currently connected. Try again later."}), 429
-            else:
-                current_user["last_seen"] = time.time()
-                return f(*args, **kwargs)
+                if token != state.current_user["token"]:
+                    return jsonify({"error": "Another user is currently connected. Try again later."}), 429
+                state.current_user["last_seen"] = time.time()
+        return f(*args, **kwargs)
     return wrapper
 
 
 # custom functions
 from model_manager import create_working_model, predict
 
-app = Flask(__name__)
-CORS(app)
+class OrjsonProvider(JSONProvider):
+    """
+    JSON provider backed by orjson, which serializes (and parses) several
+    times faster than the stdlib json used by jsonify.
+    """
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
-# load folder paths
-load_dotenv()
 
+# load folder paths once at import; every handler uses these precomputed,
+# normalized constants instead of re-reading the environment
+load_dotenv()
 
-WORKING_DIR = os.getenv("WORKING_DIR")
-SAMPLE_DIR = os.getenv("SAMPLE_DIR")
+WORKING_DIR = os.path.normpath(os.getenv("WORKING_DIR"))
+SAMPLE_DIR = os.path.normpath(os.getenv("SAMPLE_DIR"))
 
 INPUT_FOLDER = os.path.join(WORKING_DIR, "input")
 os.makedirs(INPUT_FOLDER, exist_ok=True)
@@ -56,46 +109,144 @@ TRASH_FOLDER = os.path.join(WORKING_DIR, "trash")
 os.makedirs(TRASH_FOLDER, exist_ok=True)
 
 
-# =================== Global Process Lock ===================
+app = Flask(__name__)
+app.json = OrjsonProvider(app)
+CORS(app, expose_headers=["X-Image-Name"])
 
-# process_lock = threading.Lock()
+# hand file transfers off to the reverse proxy (nginx/Apache) when one is configured
+app.use_x_sendfile = os.getenv("USE_X_SENDFILE", "").lower() in ("1", "true")
 
-# def single_process(func):
-#     @wraps(func)
-#     def wrapper(*args, **kwargs):
-#         if process_lock.locked():
-#             return jsonify({"message": "Another process is currently running. Please wait."}), 429
-#         with process_lock:
-#             return func(*args, **kwargs)
-#     return wrapper
 
+# =================== Helper Functions ===================
 
-# =================== Global Variables ===================
+@lru_cache(maxsize=512)
+def _encoded_image(image_path, mtime_ns, size):
+    """
+    Base64-encodes an image by memory-mapping it and passing the mapping
+    straight to b64encode (which accepts any buffer object), so no bytes
+    copy of the file is ever allocated and pages fault in on demand.
+    The mtime_ns/size key arguments invalidate the cache entry whenever
+    the file on disk is replaced.
+    """
+    if size == 0:
+        return ""
+    with open(image_path, "rb") as img:
+        with mmap.mmap(img.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return base64.b64encode(mm).decode('ascii')
 
-# this could be optimized --- from collections import OrderedDict
+def get_image_data(image_path):
+    st = os.stat(image_path)
+    return _encoded_image(image_path, st.st_mtime_ns, st.st_size)
 
-update_stack = [] # stack of update actions (storing image names)
+def folder_is_empty(folder_path):
+    """
+    True if the folder has no entries. Stops at the first entry instead of
+    listing the whole directory.
+    """
+    with os.scandir(folder_path) as entries:
+        return next(entries, None) is None
 
-update_stack_dict = {} # dictionary with keys
-    #     "image_name"
-    # and value
-    #     "target_folder": target_folder
-    # predictions are not stored, they are recalculated
+def get_pending_images():
+    """
+    Returns the set of image names with a pending action, for O(1) membership tests.
+    Callers should hold state.lock.
+    """
+    return state.pending_set
 
-folders = {} # dictionary with keys
-    #     "folder_name"
-    # and values
-    #     "is_empty": True/False
-    #     "has_pending": True/False
-    # thus => can_delete = is_empty and has_pending == 0
+class _InputFolderHandler(FileSystemEventHandler):
+    """
+    Keeps the in-memory input_files listing in sync with INPUT_FOLDER.
+    Runs on the watchdog observer thread, so it takes state.lock.
+    """
+    def _add(self, path):
+        name = os.path.basename(path)
+        with state.lock:
+            if name not in state.input_files:
+                state.input_files.append(name)
+
+    def _remove(self, path):
+        name = os.path.basename(path)
+        with state.lock:
+            try:
+                state.input_files.remove(name)
+            except ValueError:
+                pass
 
+    def on_created(self, event):
+        if not event.is_directory:
+            self._add(event.src_path)
 
-# =================== Helper Functions ===================
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self._remove(event.src_path)
 
-def get_image_data(image_path):
-    with open(image_path, "rb") as img:
-        image_data = base64.b64encode(img.read()).decode('utf-8')
-    return image_data
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._remove(event.src_path)
+            if os.path.dirname(event.dest_path) == INPUT_FOLDER:
+                self._add(event.dest_path)
+
+def seed_input_files():
+    """
+    Seeds input_files from a single scandir pass (sorted for a stable order).
+    """
+    with os.scandir(INPUT_FOLDER) as entries:
+        names = sorted(entry.name for entry in entries if entry.is_file())
+    with state.lock:
+        state.input_files = deque(names)
+
+def start_input_observer():
+    """
+    (Re)starts the watchdog observer on INPUT_FOLDER.
+    """
+    stop_input_observer()
+    observer = Observer()
+    observer.daemon = True
+    observer.schedule(_InputFolderHandler(), INPUT_FOLDER)
+    observer.start()
+    with state.lock:
+        state.input_observer = observer
+
+def stop_input_observer():
+    with state.lock:
+        observer = state.input_observer
+        state.input_observer = None
+    if observer is not None:
+        observer.stop()
+
+def _move_committed_image(action):
+    """
+    Moves a single committed image into its target folder.
+    Runs on a worker thread, so it must not touch shared state.
+    Returns (image_name, target_folder, error message or None).
+    """
+    image_name, target_folder = action
+    image_path = os.path.join(INPUT_FOLDER, image_name)
+    target_path = os.path.join(WORKING_DIR, target_folder, image_name)
+
+    try:
+        try:
+            # source and target are both under WORKING_DIR, so a plain rename
+            # (a single syscall) almost always works; a missing source shows
+            # up here too, with no separate exists() check beforehand
+            os.replace(image_path, target_path)
+        except FileNotFoundError:
+            return (image_name, target_folder, f"Image '{image_name}' not found in input folder.")
+        except OSError:
+            # cross-device fallback (e.g. bind mounts): copy + delete
+            shutil.move(image_path, target_path)
+        return (image_name, target_folder, None)
+    except Exception as e:
+        return (image_name, target_folder, f"Error moving '{image_name}' to '{target_folder}': {str(e)}")
+
+def send_image(image_path, image_name):
+    """
+    Returns the raw image bytes via send_file (zero-copy where the WSGI server
+    supports it), with the image name in the X-Image-Name response header.
+    """
+    response = send_file(image_path, mimetype="image/jpeg", conditional=True)
+    response.headers["X-Image-Name"] = image_name
+    return response
 
 def load_sample_data():
     """
@@ -103,7 +254,7 @@ def load_sample_data():
     copies all files and subdirectories from the sample data folder (SAMPLE_DIR)
     into it, making an exact copy.
     """
-        
+
     if not os.path.exists(SAMPLE_DIR):
         print("No sample data folder found at:", SAMPLE_DIR)
         return
@@ -116,7 +267,7 @@ def load_sample_data():
             return
 
     os.makedirs(WORKING_DIR, exist_ok=True)
-    
+
     # Copy all contents from SAMPLE_DIR to data_dir.
     for item in os.listdir(SAMPLE_DIR):
         source_item = os.path.join(SAMPLE_DIR, item)
@@ -134,58 +285,60 @@ def initialize_app():
     Initializes the working directory:
       - Loads sample data (clearing any previous data)
       - Creates the working model
-      - Scans the working directory to populate the global folders variable
-      - Resets update stacks.
+      - Scans the working directory to populate state.folders
+      - Resets the action queue and input listing.
     """
-    global update_stack, update_stack_dict, folders
-    update_stack = []
-    update_stack_dict = {}
-    folders = {}
-
     print("Initializing model and working directory...")
 
+    stop_input_observer()  # the watched directory is about to be replaced
     load_sample_data()
     create_working_model(WORKING_DIR)
+    seed_input_files()
+    start_input_observer()
 
-    # Process folders in the working directory
-    for f in os.listdir(WORKING_DIR):
-        folder_path = os.path.join(WORKING_DIR, f)
-        if os.path.isdir(folder_path) and f.lower() not in ['input', 'trash']:
-            is_empty = (len(os.listdir(folder_path)) == 0)
-            folders[f] = {
-                "is_empty": is_empty,
-                "has_pending": 0
-            }
+    folders = {}
+    # Process folders in the working directory (scandir avoids a stat per entry)
+    with os.scandir(WORKING_DIR) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False) and entry.name.lower() not in ['input', 'trash']:
+                folders[entry.name] = {
+                    "is_empty": folder_is_empty(entry.path),
+                    "has_pending": 0
+                }
 
     # also add "input" and "trash" folders
     folders["input"] = {
-        "is_empty": (len(os.listdir(INPUT_FOLDER)) == 0),
+        "is_empty": folder_is_empty(INPUT_FOLDER),
         "has_pending": 0
     }
     folders["trash"] = {
-        "is_empty": (len(os.listdir(TRASH_FOLDER)) == 0),
+        "is_empty": folder_is_empty(TRASH_FOLDER),
         "has_pending": 0
     }
 
+    with state.lock:
+        state.reset_actions()
+        state.folders = folders
+
 # =================== API Endpoints ===================
 
 @app.route('/heartbeat', methods=['GET'])
 def heartbeat():
-    global current_user
     token = request.headers.get("X-User-Token")
-    if current_user is not None and (time.time() - current_user["last_seen"]) > HEARTBEAT_TIMEOUT:
-        current_user = None
-    if current_user is None:
-        if not token:
-            token = str(uuid.uuid4())
-        current_user = {"token": token, "last_seen": time.time()}
-        return jsonify({"message": "Heartbeat registered", "token": token})
-    else:
-        if token != current_user["token"]:
-            return jsonify({"error": "Another user is currently connected. Try again later."}), 429
+    with state.lock:
+        if state.current_user is not None and (time.time() - state.current_user["last_seen"]) > HEARTBEAT_TIMEOUT:
+            state.current_user = None
+        if state.current_user is None:
+            if not token:
+                token = str(uuid.uuid4())
+            state.current_user = {"token": token, "last_seen": time.time()}
+            return jsonify({"message": "Heartbeat registered", "token": token})
         else:
-            current_user["last_seen"] = time.time()
-            return jsonify({"message": "Heartbeat updated", "token": token})
+            if token != state.current_user["token"]:
+                return jsonify({"error": "Another user is currently connected. Try again later."}), 429
+            else:
+                state.current_user["last_seen"] = time.time()
+                return jsonify({"message": "Heartbeat updated", "token": token})
 
 @app.route('/')
 def hello_world():
@@ -196,46 +349,91 @@ def hello_world():
 def api_initialize_model_endpoint():
     try:
         initialize_app()
-        return jsonify({"message": "Model initialization complete.", "folders": folders})
+        with state.lock:
+            return jsonify({"message": "Model initialization complete.", "folders": state.folders})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/image_data', methods=['POST'])
 @require_connection
-# @single_process
 def api_get_image_data():
     """
-    Returns the image data for a given image name.
+    Returns the raw image bytes for a given image name.
     """
     data = request.json
     image_name = data.get("image_name")
-    
+
     if not image_name:
         return jsonify({"error": "No image file specified"}), 400
-    
+
     image_path = os.path.join(INPUT_FOLDER, image_name)
-    if not os.path.exists(image_path):
+    try:
+        return send_image(image_path, image_name)
+    except FileNotFoundError:
+        return jsonify({"error": "Image not found in input folder"}), 404
+
+@app.route('/image/raw/<image_name>', methods=['GET'])
+@require_connection
+def api_get_raw_image(image_name):
+    """
+    Returns the raw image bytes for an image in the input folder.
+    """
+    image_name = os.path.basename(image_name)
+    image_path = os.path.join(INPUT_FOLDER, image_name)
+    try:
+        return send_image(image_path, image_name)
+    except FileNotFoundError:
         return jsonify({"error": "Image not found in input folder"}), 404
-    
-    image_data = get_image_data(image_path)
-    return jsonify({
-        "image_name": image_name,
-        "image_data": image_data,
-        "mime_type": "image/jpeg"
-    })
 
 @app.route('/stack', methods=['GET'])
 @require_connection
-# @single_process
 def api_get_stack():
     """
     Returns the current pending actions stored in update_stack.
+    Each entry carries a preview_url pointing at /image/raw/<name>, so the
+    client fetches previews as plain JPEGs (and its HTTP cache handles
+    repeated polls) instead of receiving inline base64.
+    """
+    with state.lock:
+        return jsonify({"stack": [
+            {
+                "image_name": image_name,
+                "target_folder": state.update_stack_dict[image_name],
+                "preview_url": f"/image/raw/{quote(image_name)}"
+            }
+            for image_name in state.update_stack
+        ]})
+
+@app.route('/stack/previews', methods=['GET'])
+@require_connection
+def api_stream_stack_previews():
+    """
+    Streams the pending actions as newline-delimited JSON, one entry per
+    line with an inline base64 preview. Each line is flushed as it is
+    encoded, so clients can render the first preview without waiting for
+    the whole payload.
     """
-    return jsonify({"stack": update_stack})
+    with state.lock:
+        entries = [(image_name, state.update_stack_dict[image_name])
+                   for image_name in state.update_stack]
+
+    def generate():
+        for image_name, target_folder in entries:
+            image_path = os.path.join(INPUT_FOLDER, image_name)
+            try:
+                preview = get_image_data(image_path)
+            except FileNotFoundError:
+                preview = None
+            yield orjson.dumps({
+                "image_name": image_name,
+                "target_folder": target_folder,
+                "preview": preview
+            }) + b"\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/update', methods=['POST'])
 @require_connection
-# @single_process
 def api_add_to_stack():
     """
     Adds a pending action to update_stack.
@@ -243,184 +441,183 @@ def api_add_to_stack():
     The entry added will be { "image_name": <image_name>, "target_folder": <folder_name> }.
     After adding, refresh the folders (to update has_pending).
     """
-    global update_stack
-    global update_stack_dict
-    global folders
-
     data = request.json
     if not isinstance(data, dict):
         return jsonify({"error": "Expected a JSON object with keys 'image' and 'target_folder'"}), 400
-    
+
     image_name = data.get("image_name")
     target_folder = data.get("target_folder")
 
     if not target_folder:
         return jsonify({"error": "Target folder not specified"}), 400
-    
+
     source_path = os.path.join(INPUT_FOLDER, image_name)
     if not os.path.exists(source_path):
         return jsonify({"error": "Image not found in input folder"}), 404
-    
-    if image_name in update_stack:
-        return jsonify({"error": "Image already pending action"}), 400
 
-    update_stack.append(image_name)
-    update_stack_dict[image_name] = target_folder
-    folders[target_folder]["has_pending"] += 1
-    return jsonify({
-        "message": f"Pending action added for image '{image_name}' to move to '{target_folder}'.",
-        "stack": update_stack
-    })
+    with state.lock:
+        if image_name in state.pending_set:
+            return jsonify({"error": "Image already pending action"}), 400
+
+        state.update_stack.append(image_name)
+        state.update_stack_dict[image_name] = target_folder
+        state.pending_set.add(image_name)
+        state.folders[target_folder]["has_pending"] += 1
+        return jsonify({
+            "message": f"Pending action added for image '{image_name}' to move to '{target_folder}'.",
+            "stack": list(state.update_stack)
+        })
 
 @app.route('/undo', methods=['POST'])
 @require_connection
-# @single_process
 def api_pop_from_stack():
     """
     Removes the last pending action from update_stack.
     Returns the restored image (if available) and the updated stack.
     Also refreshes folders.
     """
-    global update_stack
-    global update_stack_dict
-    global folders
+    with state.lock:
+        if not state.update_stack:
+            return jsonify({"error": "No actions to undo"}), 400
 
-    if not update_stack:
-        return jsonify({"error": "No actions to undo"}), 400
-    
-    image_name = update_stack.pop()
-    target_folder = update_stack_dict[image_name]
-    del update_stack_dict[image_name]
+        image_name = state.update_stack.pop()
+        target_folder = state.update_stack_dict[image_name]
+        del state.update_stack_dict[image_name]
+        state.pending_set.discard(image_name)
 
-    folders[target_folder]["has_pending"] -= 1
-    
-    return jsonify({
-        "message": f"Removed pending action for image '{image_name}' targeting '{target_folder}'.",
-        "stack": update_stack}
-    )
+        state.folders[target_folder]["has_pending"] -= 1
+
+        return jsonify({
+            "message": f"Removed pending action for image '{image_name}' targeting '{target_folder}'.",
+            "stack": list(state.update_stack)}
+        )
 
 @app.route('/folders', methods=['GET'])
 @require_connection
-# @single_process
 def api_get_folders():
     """
-    Returns the list of folders in the working directory.    
+    Returns the list of folders in the working directory.
     """
-    global folders
-    return jsonify({"folders": folders})
+    with state.lock:
+        return jsonify({"folders": state.folders})
 
 @app.route('/folder', methods=['POST'])
 @require_connection
-# @single_process
 def api_manage_folder():
     """
     Create or delete a folder.
     Expected payload: { "operation": "create"/"delete", "folder_name": <name> }
-    After performing the operation, refresh the folders global variable.
+    After performing the operation, refresh state.folders.
     """
     data = request.json
     operation = data.get("operation")
     folder_name = data.get("folder_name")
-    
+
     if not operation or not folder_name:
         return jsonify({"error": "Operation and folder name required"}), 400
-    
+
     # prevent deletion of the 'input' or 'trash' folders
     if operation == "delete" and (folder_name.lower() == "input" or folder_name.lower() == "trash"):
         return jsonify({"error": "Cannot delete the input or trash folder"}), 400
 
     folder_path = os.path.join(WORKING_DIR, folder_name)
-    
+
     try:
-        global folders
-        message = ""
-        if operation == "create":
-            if folder_name in folders:
-                return jsonify({"error": f"Folder '{folder_name}' already exists."}), 400
-            os.makedirs(folder_path, exist_ok=True)
-            folders[folder_name] = {"is_empty": True, "has_pending": 0}
-            message = f"Folder '{folder_name}' created."
-        elif operation == "delete":
-            if folder_name not in folders:
-                return jsonify({"error": f"Folder '{folder_name}' does not exist."}), 400
-            if not folders[folder_name]["is_empty"]:
-                return jsonify({"error": f"Folder '{folder_name}' is not empty and thus cannot be deleted."}), 400
-            shutil.rmtree(folder_path)
-            del folders[folder_name]
-            message = f"Folder '{folder_name}' deleted."
-        else:
-            return jsonify({"error": "Invalid operation"}), 400
-        
-        return jsonify({"message": message})
+        with state.lock:
+            message = ""
+            if operation == "create":
+                if folder_name in state.folders:
+                    return jsonify({"error": f"Folder '{folder_name}' already exists."}), 400
+                os.makedirs(folder_path, exist_ok=True)
+                state.folders[folder_name] = {"is_empty": True, "has_pending": 0}
+                message = f"Folder '{folder_name}' created."
+            elif operation == "delete":
+                if folder_name not in state.folders:
+                    return jsonify({"error": f"Folder '{folder_name}' does not exist."}), 400
+                if not state.folders[folder_name]["is_empty"]:
+                    return jsonify({"error": f"Folder '{folder_name}' is not empty and thus cannot be deleted."}), 400
+                shutil.rmtree(folder_path)
+                del state.folders[folder_name]
+                message = f"Folder '{folder_name}' deleted."
+            else:
+                return jsonify({"error": "Invalid operation"}), 400
+
+            return jsonify({"message": message})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/current_image', methods=['GET'])
 @require_connection
-# @single_process
 def api_get_current_image():
     """
     Returns the first image from the input folder that is not pending.
     """
-    global update_stack
-    global folders
-
-    pending_set = set(update_stack)  # for O(1) tests
-    
-    found = None
-    with os.scandir(INPUT_FOLDER) as entries:
-        sorted_entries = sorted(entries, key=lambda entry: entry.name)
-        for entry in sorted_entries:
-            if entry.is_file() and entry.name not in pending_set:
-                found = entry.name
-                break
-
-    if not found:
-        folders["input"]["is_empty"] = True
-        return jsonify({"error": "No images found in input folder"}), 404
-
-    image_name = found
-    image_path = os.path.join(INPUT_FOLDER, image_name)
-    image_data = get_image_data(image_path)
-
-    return jsonify({
-        "image_name": image_name,
-        "image_data": image_data,
-        "mime_type": "image/jpeg"
-    })
+    while True:
+        with state.lock:
+            if state.input_observer is None:
+                # first call without /initialize: seed from disk and start watching
+                seed_input_files()
+                start_input_observer()
+
+            pending_set = get_pending_images()
+
+            found = None
+            for name in state.input_files:
+                if name not in pending_set:
+                    found = name
+                    break
+
+            if not found:
+                state.folders["input"]["is_empty"] = True
+                return jsonify({"error": "No images found in input folder"}), 404
+
+        image_path = os.path.join(INPUT_FOLDER, found)
+        try:
+            return send_image(image_path, found)
+        except FileNotFoundError:
+            # the in-memory listing can briefly lag the filesystem (watchdog
+            # delivery after /commit moves, or an external delete); drop the
+            # stale name and try the next candidate
+            with state.lock:
+                try:
+                    state.input_files.remove(found)
+                except ValueError:
+                    pass
 
 @app.route('/classify', methods=['POST'])
 @require_connection
-# @single_process
 def api_classify_image():
     """
     Returns classification predictions for a given image.
     Expected payload: { "image_name": <filename> }
-    Returns a dictionary mapping each category (excluding 'input' and 'trash') 
+    Returns a dictionary mapping each category (excluding 'input' and 'trash')
     to its score (0–100) if available or "N/A" if not.
     """
-    global folders
-
     data = request.json
     image_name = data.get("image_name")
-    
+
     if not image_name:
         return jsonify({"error": "No image file specified"}), 400
 
     image_path = os.path.join(INPUT_FOLDER, image_name)
+    # single stat guard: predict() cannot distinguish a missing file from
+    # malformed image data, and we want a 404 (not a 500) for the former
     if not os.path.exists(image_path):
         return jsonify({"error": "Image not found in input folder"}), 404
-    
-    image_data = get_image_data(image_path)
-    
+
     try:
-        predictions = predict(image_data)
+        # pass the path straight through; no base64 encode/decode round-trip
+        predictions = predict(image_path)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    
+
     # build full dictionary with the score or "N/A"
+    # state.folders is the in-memory cache of the working-directory listing
+    # (kept up to date by /initialize and /folder), so no fs calls here
     full_predictions = {}
-    for category in folders:
+    with state.lock:
+        categories = list(state.folders)
+    for category in categories:
         if category.lower() == "input":
             continue
         if category in predictions:
@@ -437,7 +634,6 @@ def api_classify_image():
 
 @app.route('/commit', methods=['POST'])
 @require_connection
-# # @single_process
 def api_commit_actions():
     """
     Processes all pending actions:
@@ -446,47 +642,47 @@ def api_commit_actions():
       - Clears update_stack.
       - Refreshes folders.
     """
-    global update_stack
-    global update_stack_dict
-    global folders
-
     results = {"moved": [], "errors": []}
-    changes_made = False
-    
-    while update_stack:
 
-        image_name = update_stack.pop()
-        image_path = os.path.join(INPUT_FOLDER, image_name)
-        target_folder = update_stack_dict[image_name]
-        target_path = os.path.join(WORKING_DIR, target_folder, image_name)
-
-        del update_stack_dict[image_name]
-        folders[target_folder]["has_pending"] -= 1
-
-        
-        if not os.path.exists(image_path):
-            results["errors"].append(f"Image '{image_name}' not found in input folder.")
-            continue
-        
-        try:
+    # drain the queue first (FIFO); shared state is only touched under the lock
+    actions = []
+    with state.lock:
+        while state.update_stack:
+            image_name = state.update_stack.popleft() # FIFO: process actions in the order they were queued
+            target_folder = state.update_stack_dict[image_name]
+            del state.update_stack_dict[image_name]
+            state.pending_set.discard(image_name)
+            state.folders[target_folder]["has_pending"] -= 1
+            actions.append((image_name, target_folder))
+
+    # the moves are I/O-bound and target distinct files, so run them
+    # concurrently — and without holding the state lock
+    move_results = []
+    if actions:
+        # ensure each distinct target folder exists once up front, so the
+        # per-move work is a single rename syscall
+        for target_folder in {target for _, target in actions}:
             os.makedirs(os.path.join(WORKING_DIR, target_folder), exist_ok=True)
-            shutil.move(image_path, target_path)
-            results["moved"].append(image_name)
-
-            folders[target_folder]["is_empty"] = False
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            move_results = list(executor.map(_move_committed_image, actions))
 
-            changes_made = True
+    changes_made = False
+    with state.lock:
+        for image_name, target_folder, error in move_results:
+            if error:
+                results["errors"].append(error)
+            else:
+                results["moved"].append(image_name)
+                state.folders[target_folder]["is_empty"] = False
+                changes_made = True
 
-        except Exception as e:
-            results["errors"].append(f"Error moving '{image_name}' to '{target_folder}': {str(e)}")
-    
-    # update with the newly committed images
+    # update with the newly committed images (slow: done outside the lock)
     if changes_made:
         try:
             create_working_model(WORKING_DIR)
         except Exception as e:
             results["errors"].append(f"Error retraining model: {str(e)}")
-    
+
     if results["errors"]:
         return jsonify({"error": "Errors occurred during commit.", "results": results}), 400
     else:
@@ -496,4 +692,14 @@ def api_commit_actions():
 if __name__ == '__main__':
     initialize_app()
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    try:
+        # threaded production server: slow I/O-bound requests (/commit moves,
+        # image reads) no longer block small ones like /heartbeat. Handlers
+        # only hold state.lock around in-memory mutations — never across file
+        # I/O or model work — so an async/ASGI port would buy little here.
+        from waitress import serve
+        print(f"Serving with waitress on port {port}")
+        serve(app, host='0.0.0.0', port=port, threads=16)
+    except ImportError:
+        print("waitress not installed, falling back to the Flask dev server")
+        app.run(host='0.0.0.0', port=port)
@@ -2,67 +2,93 @@ import os
 import json
 import io
 import argparse
-import hashlib
 import math
 import base64
+import multiprocessing
+import blake3
+from functools import lru_cache
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import DataLoader, Dataset
-from torchvision import models, transforms
+from torch.utils.data import DataLoader, Dataset, TensorDataset
+from torchvision import models
+from torchvision import io as tv_io
+from torchvision.transforms import v2
 from torchvision.models import ResNet50_Weights
-from PIL import Image
+from PIL import Image, features
 from dotenv import load_dotenv
 
+# optional: when onnxruntime is installed, predictions run through the
+# exported ONNX graph instead of eager PyTorch
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# the PIL fallback decode path is much faster when Pillow is backed by
+# libjpeg-turbo (SIMD IDCT and color conversion); pillow-simd is a drop-in
+# replacement that guarantees it
+if not features.check_feature("libjpeg_turbo"):
+    print("Warning: Pillow is not built against libjpeg-turbo; "
+          "JPEG decodes on the PIL fallback path will be slow. "
+          "Consider installing pillow-simd.")
+
 
 ARTIFACTS_DIR = "./model_artifacts"
 if not os.path.exists(ARTIFACTS_DIR):
     os.makedirs(ARTIFACTS_DIR)
 MODEL_PATH = os.path.join(ARTIFACTS_DIR, "model.pth")
+MODEL_ONNX_PATH = os.path.join(ARTIFACTS_DIR, "model.onnx")
 TRAINING_DATA_HASH_PATH = os.path.join(ARTIFACTS_DIR, "hashed_training_data.json")
 
 load_dotenv()
-WORKING_DIR = os.getenv("WORKING_DIR")
-SAMPLE_DIR = os.getenv("SAMPLE_DIR")
+WORKING_DIR = os.path.normpath(os.getenv("WORKING_DIR")) if os.getenv("WORKING_DIR") else None
+SAMPLE_DIR = os.path.normpath(os.getenv("SAMPLE_DIR")) if os.getenv("SAMPLE_DIR") else None
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 NUM_EPOCHS = 5
 BATCH_SIZE = 16
 LEARNING_RATE = 0.005
+AUGMENT_PASSES = 3  # feature-extraction passes when random augmentation is on
+
 
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
 
-test_transforms = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+# transforms.v2 pipelines run on uint8 tensors with vectorized kernels
+# (several times faster than the PIL-based v1 ops); v2.ToImage() still
+# accepts PIL images for the fallback decode path.
+# The deterministic stages (decode target size, dtype, normalization) are
+# split out from the random augmentations so the resized uint8 tensors can
+# be computed once and cached across epochs.
+resize_transforms = v2.Compose([
+    v2.ToImage(),
+    v2.Resize((224, 224), antialias=True)
 ])
 
+normalize_transforms = v2.Compose([
+    v2.ToDtype(torch.float32, scale=True),
+    v2.Normalize(IMAGENET_MEAN, IMAGENET_STD)
+])
+
+test_transforms = v2.Compose([resize_transforms, normalize_transforms])
+
 # hardcode the training mode
 mode = "mild"
 
 if mode == "none":
-    train_transforms = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-    ])
+    augment_transforms = None
 elif mode == "mild":
-    train_transforms = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.RandomHorizontalFlip(),
-        transforms.RandomRotation(degrees=10),
-        transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+    augment_transforms = v2.Compose([
+        v2.RandomHorizontalFlip(),
+        v2.RandomRotation(degrees=10)
     ])
 elif mode == "heavy":
-    train_transforms = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.RandomHorizontalFlip(),
-        transforms.RandomRotation(degrees=45),
-        transforms.ColorJitter(brightness=0.5, contrast=0.5, saturation=0.5),
-        transforms.RandomResizedCrop(224, scale=(0.8, 1.0)),
-        transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+    augment_transforms = v2.Compose([
+        v2.RandomHorizontalFlip(),
+        v2.RandomRotation(degrees=45),
+        v2.ColorJitter(brightness=0.5, contrast=0.5, saturation=0.5),
+        v2.RandomResizedCrop(224, scale=(0.8, 1.0), antialias=True)
     ])
 
 def load_image(source):
@@ -79,6 +105,17 @@ def load_image(source):
         image = image.convert("RGBA")
     return image.convert("RGB")
 
+def load_image_tensor(path):
+    """
+    Decodes an image straight to an RGB uint8 tensor via torchvision.io
+    (libjpeg/libpng without the PIL round-trip). Falls back to PIL for
+    anything decode_image cannot handle.
+    """
+    try:
+        return tv_io.decode_image(path, mode=tv_io.ImageReadMode.RGB)
+    except Exception:
+        return v2.functional.pil_to_tensor(load_image(path))
+
 def process_image_input(data):
     """
     Processes the input image data, which can be:
@@ -110,38 +147,44 @@ def get_category_image_paths(working_dir):
     allowed_extensions = {".jpg", ".jpeg", ".png"}
     categories = []
     data = []  # list of tuples: (image_path, category)
-    for item in os.listdir(working_dir):
-        item_path = os.path.join(working_dir, item)
-        if os.path.isdir(item_path) and item.lower() != 'input':
-            categories.append(item)
-            for file in os.listdir(item_path):
-                ext = os.path.splitext(file)[1].lower()
-                if ext in allowed_extensions:
-                    file_path = os.path.join(item_path, file)
-                    data.append((file_path, item))
+    # scandir gives the dir/file bit from the readdir data itself, so no
+    # per-entry stat calls are needed for the type checks
+    with os.scandir(working_dir) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False) and entry.name.lower() != 'input':
+                categories.append(entry.name)
+                with os.scandir(entry.path) as files:
+                    for file_entry in files:
+                        ext = os.path.splitext(file_entry.name)[1].lower()
+                        if ext in allowed_extensions:
+                            data.append((file_entry.path, entry.name))
     return sorted(list(set(categories))), data
 
 
-class CategoryDataset(Dataset):
+class CachedCategoryDataset(Dataset):
     """
     Dataset for images organized in category folders.
+    Decodes and resizes every image once up front and keeps the resulting
+    (3, 224, 224) uint8 tensors in memory (~150 KB each), so epochs 2..N
+    skip JPEG decode entirely. Items come back as raw uint8: augmentation
+    and normalization run batched on the device (see _extract_features),
+    and the uint8 batches are a quarter the size to copy over.
     """
-    def __init__(self, data, category_to_idx, transform):
-        self.data = data
-        self.category_to_idx = category_to_idx
-        self.transform = transform
+    def __init__(self, data, category_to_idx):
+        self.labels = [category_to_idx[category] for _, category in data]
+        if data:
+            self.images = torch.stack(
+                [resize_transforms(load_image_tensor(path)) for path, _ in data])
+        else:
+            self.images = torch.empty((0, 3, 224, 224), dtype=torch.uint8)
 
     def __len__(self):
-        return len(self.data)
+        return len(self.labels)
 
     def __getitem__(self, idx):
-        image_path, category = self.data[idx]
-        image = load_image(image_path)
-        if self.transform:
-            image = self.transform(image)
-        label = self.category_to_idx[category]
-        return image, label
-    
+        return self.images[idx], self.labels[idx]
+
+
 
 def train_model(model, dataloader, criterion, optimizer, num_epochs):
     """
@@ -149,78 +192,186 @@ def train_model(model, dataloader, criterion, optimizer, num_epochs):
     """
     model.train()
     for epoch in range(num_epochs):
-        running_loss = 0.0
+        # accumulate on-device; a Python float here would force a host<->device
+        # sync (.item()) after every step and stall the pipeline
+        running_loss = torch.zeros((), device=DEVICE)
         for inputs, labels in dataloader:
-            inputs = inputs.to(DEVICE)
-            labels = labels.to(DEVICE)
-            optimizer.zero_grad()
-            outputs = model(inputs)
-            loss = criterion(outputs, labels)
+            # non_blocking lets pinned-memory batches overlap the copy with compute
+            inputs = inputs.to(DEVICE, non_blocking=True)
+            labels = labels.to(DEVICE, non_blocking=True)
+            # set_to_none drops the grad tensors instead of memsetting them;
+            # backward then writes fresh grads rather than accumulating.
+            # autograd never touches the backbone anyway: it runs under
+            # no_grad in _extract_features, so backward stops at the head.
+            optimizer.zero_grad(set_to_none=True)
+            # BF16 autocast: tensor cores / wider SIMD on the frozen conv
+            # backbone; no GradScaler needed since BF16 keeps FP32's range
+            with torch.autocast(device_type=DEVICE.type, dtype=torch.bfloat16):
+                outputs = model(inputs)
+                loss = criterion(outputs, labels)
             loss.backward()
             optimizer.step()
-            running_loss += loss.item() * inputs.size(0)
-        epoch_loss = running_loss / len(dataloader.dataset)
+            running_loss += loss.detach() * inputs.size(0)
+        epoch_loss = (running_loss / len(dataloader.dataset)).item()
         print(f"Epoch {epoch+1}/{num_epochs}, Loss: {epoch_loss:.4f}")
     return model
 
 
+def _hash_file(job):
+    """
+    Hashes one file incrementally in 1 MiB blocks, so large images never sit
+    in memory whole. Runs in a worker process.
+    Returns (category, filename, hexdigest).
+    """
+    category, filename, file_path = job
+    # change-detection only needs a fast digest, not a cryptographic one;
+    # BLAKE3's SIMD implementation is several times faster than sha256
+    digest = blake3.blake3()
+    with open(file_path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return (category, filename, digest.hexdigest())
+
+
+def _extract_features(backbone, dataloader, passes, augment=None):
+    """
+    Runs the frozen backbone over the dataset and returns the pooled
+    2048-d feature vectors with their labels. With random augmentation
+    enabled, `passes` full passes are made so the head still sees several
+    augmented variants of each image.
+    """
+    # eval() keeps every BatchNorm in inference mode, so the running stats
+    # stay at their ImageNet-pretrained values (standard when training only
+    # a head on a frozen backbone) and no batch_norm_stats reductions run
+    backbone.eval()
+    features = []
+    labels = []
+    with torch.no_grad():
+        for _ in range(passes):
+            for inputs, batch_labels in dataloader:
+                # batches arrive as raw uint8; augmentation + normalization
+                # run here as one vectorized v2 kernel per op over the whole
+                # batch on the device, instead of per image in the workers
+                inputs = inputs.to(DEVICE, non_blocking=True)
+                if augment is not None:
+                    inputs = augment(inputs)
+                inputs = normalize_transforms(inputs).to(
+                    memory_format=torch.channels_last)
+                with torch.autocast(device_type=DEVICE.type, dtype=torch.bfloat16):
+                    outputs = backbone(inputs)
+                features.append(outputs.float().cpu())
+                labels.append(batch_labels)
+    return torch.cat(features), torch.cat(labels)
+
+
 def compute_training_data_hash(working_dir, categories=None):
     """
     Scans the working directory for category folders (excluding 'input')
-    and computes a hash for each image.
+    and computes a hash for each image, fanning the hashing out over a
+    process pool since it is CPU-bound.
     Returns a dictionary with keys 'categories' and 'data' (mapping category to list of image info).
     """
     allowed_extensions = {".jpg", ".jpeg", ".png"}
     training_data = {}
     computed_categories = []
-    for item in os.listdir(working_dir):
-        item_path = os.path.join(working_dir, item)
-        if os.path.isdir(item_path) and item.lower() != 'input':
-            computed_categories.append(item)
-            images_info = []
-            for file in os.listdir(item_path):
-                ext = os.path.splitext(file)[1].lower()
-                if ext in allowed_extensions:
-                    file_path = os.path.join(item_path, file)
-                    with open(file_path, "rb") as f:
-                        file_data = f.read()
-                    file_hash = hashlib.sha256(file_data).hexdigest()
-                    images_info.append({"filename": file, "hash": file_hash})
-            images_info = sorted(images_info, key=lambda x: x["filename"])
-            training_data[item] = images_info
+    jobs = []
+    with os.scandir(working_dir) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False) and entry.name.lower() != 'input':
+                computed_categories.append(entry.name)
+                training_data[entry.name] = []
+                with os.scandir(entry.path) as files:
+                    for file_entry in files:
+                        ext = os.path.splitext(file_entry.name)[1].lower()
+                        if ext in allowed_extensions:
+                            jobs.append((entry.name, file_entry.name, file_entry.path))
+
+    if jobs:
+        with multiprocessing.Pool(os.cpu_count()) as pool:
+            for category, filename, file_hash in pool.imap_unordered(_hash_file, jobs, chunksize=64):
+                training_data[category].append({"filename": filename, "hash": file_hash})
+
+    for item in training_data:
+        training_data[item] = sorted(training_data[item], key=lambda x: x["filename"])
     computed_categories = sorted(list(set(computed_categories)))
     if not categories: # in case this is called from create_working_model
         categories = computed_categories
-    return {"categories": categories, "data": training_data}
+    # hash_algo is recorded so a stored file written with an older digest
+    # (sha256) simply fails the comparison and forces one rebuild
+    return {"categories": categories, "hash_algo": "blake3", "data": training_data}
+
+
+def _training_data_fingerprint(training_hash):
+    """Single digest over the canonical JSON form of a training-data hash dict."""
+    return blake3.blake3(json.dumps(training_hash, sort_keys=True).encode()).hexdigest()
+
+
+def _stored_training_data_is_current(working_dir, stored_hash):
+    """
+    Cheap warm-start check: stat every image instead of hashing it. The
+    stored hash is still current when the on-disk (category, filename) set
+    matches and no image is newer than the hash file itself.
+    """
+    try:
+        hash_mtime = os.path.getmtime(TRAINING_DATA_HASH_PATH)
+    except OSError:
+        return False
+    _, data_paths = get_category_image_paths(working_dir)
+    on_disk = {(category, os.path.basename(path)) for path, category in data_paths}
+    stored = {(category, entry["filename"])
+              for category, entries in stored_hash.get("data", {}).items()
+              for entry in entries}
+    if on_disk != stored:
+        return False
+    return all(os.path.getmtime(path) <= hash_mtime for path, _ in data_paths)
 
 
 def create_working_model(working_dir):
     """
     Create a working model:
       - Scan the working directory for category folders (ignoring 'input' and 'trash').
-      - Compute a hash for each image and compare with the stored hashed_training_data.json.
+      - Check whether the training data changed since the stored hashed_training_data.json.
       - If the current state matches, load the saved model.
       - Otherwise, fine-tune a pre-trained ResNet50 on these images and update the hash file.
     """
     # try to load existing model
-    current_hash = compute_training_data_hash(working_dir)
+    stored_hash = None
     if os.path.exists(TRAINING_DATA_HASH_PATH):
         with open(TRAINING_DATA_HASH_PATH, "r") as f:
             stored_hash = json.load(f)
-        if stored_hash == current_hash and os.path.exists(MODEL_PATH):
-            print("Working directory unchanged, loading existing model.")
-            weights = ResNet50_Weights.DEFAULT
-            model = models.resnet50(weights=weights)
-            for param in model.parameters():
-                param.requires_grad = False
-            num_classes = len(stored_hash.get("categories", [])) if stored_hash.get("categories", []) else 2
-            in_features = model.fc.in_features
-            model.fc = nn.Linear(in_features, num_classes)
-            model = model.to(DEVICE)
-            model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE))
-            return model
+
+    current_hash = None
+    unchanged = False
+    if stored_hash is not None and os.path.exists(MODEL_PATH):
+        # stat-only short-circuit first; only when names match but an mtime
+        # moved do we pay for re-hashing the image contents
+        unchanged = _stored_training_data_is_current(working_dir, stored_hash)
+        if not unchanged:
+            current_hash = compute_training_data_hash(working_dir)
+            unchanged = (_training_data_fingerprint(stored_hash)
+                         == _training_data_fingerprint(current_hash))
+
+    if unchanged:
+        print("Working directory unchanged, loading existing model.")
+        # only the architecture is needed here; the saved state dict
+        # overwrites every parameter, so skip the ~100MB pretrained load
+        model = models.resnet50(weights=None)
+        for param in model.parameters():
+            param.requires_grad = False
+        num_classes = len(stored_hash.get("categories", [])) if stored_hash.get("categories", []) else 2
+        in_features = model.fc.in_features
+        model.fc = nn.Linear(in_features, num_classes)
+        model = model.to(DEVICE)
+        model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE))
+        # backfill the ONNX export for artifact dirs written before it existed
+        if not os.path.exists(MODEL_ONNX_PATH) or \
+                os.path.getmtime(MODEL_ONNX_PATH) < os.path.getmtime(MODEL_PATH):
+            _export_onnx(model)
+        return model
 
     # otherwise, train a new model
+    if current_hash is None:
+        current_hash = compute_training_data_hash(working_dir)
     categories, data_paths = get_category_image_paths(working_dir)
     if not categories or not data_paths:
         print("No valid categories with images found in working directory.")
@@ -231,69 +382,279 @@ def create_working_model(working_dir):
     else:
         category_to_idx = {}
 
-    dataset = CategoryDataset(data_paths, category_to_idx, train_transforms)
-    dataloader = DataLoader(dataset, batch_size=BATCH_SIZE, shuffle=True)
+    dataset = CachedCategoryDataset(data_paths, category_to_idx)
+    dataloader = DataLoader(
+        dataset,
+        batch_size=BATCH_SIZE,
+        shuffle=True,
+        # the dataset is a fully decoded in-memory tensor and augmentation
+        # runs on-device, so worker processes would only add IPC overhead
+        # (and pickle the whole image cache per worker on spawn platforms)
+        num_workers=0,
+        pin_memory=(DEVICE.type == "cuda"),  # enables async H2D copies
+    )
     weights = ResNet50_Weights.DEFAULT
     model = models.resnet50(weights=weights)
     for param in model.parameters():
         param.requires_grad = False
     num_classes = len(category_to_idx) if category_to_idx else 2
     in_features = model.fc.in_features
-    model.fc = nn.Linear(in_features, num_classes)
-    model = model.to(DEVICE)
+    head = nn.Linear(in_features, num_classes)
     if data_paths:
+        # the backbone is frozen, so its output for each (augmented) image
+        # never changes across epochs: run it once per augmentation pass,
+        # cache the 2048-d embeddings, and train only the linear head on them
         print("Fine-tuning model on provided categories...")
+        model.fc = nn.Identity()
+        # NHWC layout: cuDNN/oneDNN pick faster conv kernels and skip the
+        # layout reorders they otherwise insert around each conv
+        model = model.to(DEVICE, memory_format=torch.channels_last)
+        passes = AUGMENT_PASSES if augment_transforms is not None else 1
+        features, labels = _extract_features(model, dataloader, passes,
+                                             augment_transforms)
+        feature_loader = DataLoader(TensorDataset(features, labels),
+                                    batch_size=BATCH_SIZE, shuffle=True)
+        head = head.to(DEVICE)
         criterion = nn.CrossEntropyLoss()
-        optimizer = optim.Adam(model.fc.parameters(), lr=LEARNING_RATE)
-        model = train_model(model, dataloader, criterion, optimizer, NUM_EPOCHS)
+        optimizer = optim.Adam(head.parameters(), lr=LEARNING_RATE)
+        head = train_model(head, feature_loader, criterion, optimizer, NUM_EPOCHS)
+        model.fc = head
     else:
         print("No training data available, using basic fine-tuned model.")
+        model.fc = head
+        model = model.to(DEVICE)
 
     torch.save(model.state_dict(), MODEL_PATH)
+    _export_onnx(model)
     with open(TRAINING_DATA_HASH_PATH, "w") as f:
         json.dump(current_hash, f)
     print(f"Model and training data hash saved in {ARTIFACTS_DIR}.")
     return model
 
 
-def predict(image_data):
+def _calibration_batches():
     """
-    Predict the category scores for a given image.
-    Accepts image_data which can be a base64 string, raw bytes, or a valid file path.
-    Loads the model from MODEL_PATH, processes the image, and returns a dictionary mapping
-    each category to a score (0–100).
+    Yields a few preprocessed training images for post-training-quantization
+    calibration; falls back to random data when no images are available.
     """
-    if not os.path.exists(TRAINING_DATA_HASH_PATH):
-        raise FileNotFoundError("Hashed training data file not found. Please run create_working_model first.")
-    
-    with open(TRAINING_DATA_HASH_PATH, "r") as f:
-        data = json.load(f)
-    categories = data.get("categories", [])
-    if not categories:
-        raise ValueError("No categories found in training data hash.")
-    
-    # set up the saved model
-    weights = ResNet50_Weights.DEFAULT
-    model = models.resnet50(weights=weights)
+    paths = []
+    if WORKING_DIR and os.path.isdir(WORKING_DIR):
+        try:
+            _, data_paths = get_category_image_paths(WORKING_DIR)
+            paths = [path for path, _ in data_paths[:8]]
+        except OSError:
+            paths = []
+    if paths:
+        for path in paths:
+            yield test_transforms(load_image_tensor(path)).unsqueeze(0)
+    else:
+        yield torch.randn(1, 3, 224, 224)
+
+
+def _quantize_for_cpu(model):
+    """
+    Post-training static INT8 quantization via FX graph mode, routing the
+    convolutions to oneDNN's VNNI int8 path on x86. Returns None when
+    quantization fails so the caller keeps the FP32 model.
+    """
+    try:
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+        example = torch.zeros(1, 3, 224, 224)
+        prepared = prepare_fx(model, get_default_qconfig_mapping("x86"), (example,))
+        with torch.no_grad():
+            for batch in _calibration_batches():
+                prepared(batch)
+        return convert_fx(prepared)
+    except Exception as e:
+        print(f"INT8 quantization skipped, using FP32 model: {e}")
+        return None
+
+
+@lru_cache(maxsize=2)
+def _get_model(categories, model_mtime_ns):
+    """
+    Builds the inference model for the given categories and loads the saved
+    weights from MODEL_PATH. Cached on (categories, model file mtime) so
+    repeated predictions reuse the constructed model; a retrain bumps the
+    mtime and produces a fresh cache entry. The pretrained ImageNet weights
+    are skipped (weights=None) since the state dict overwrites every
+    parameter anyway.
+    """
+    model = models.resnet50(weights=None)
     for param in model.parameters():
         param.requires_grad = False
     num_classes = len(categories)
     in_features = model.fc.in_features
     model.fc = nn.Linear(in_features, num_classes)
-    model = model.to(DEVICE)
+    model = model.to(DEVICE, memory_format=torch.channels_last)
     model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE))
     model.eval()
-    
-    image = process_image_input(image_data)
-    
-    image_tensor = test_transforms(image).unsqueeze(0).to(DEVICE)
-    
-    with torch.no_grad():
-        outputs = model(image_tensor)
-        probs = torch.softmax(outputs, dim=1).cpu().numpy()[0]
-    
-    scores = {category: round(prob * 100, 2) for category, prob in zip(categories, probs)}
-    return scores
+
+    # the backbone is frozen, so every Conv2d->BatchNorm2d pair folds into a
+    # single conv with adjusted weight+bias: ~50 fewer kernels per forward
+    try:
+        from torch.fx.experimental.optimization import fuse
+        model = fuse(model)
+    except Exception as e:
+        print(f"Conv+BN fusion skipped: {e}")
+
+    # on CPU (the common deployment here), INT8 weights quarter the model's
+    # memory traffic and use VNNI int8 dot products — worth ~3-4x at bs=1
+    if DEVICE.type == "cpu":
+        quantized = _quantize_for_cpu(model)
+        if quantized is not None:
+            return quantized
+
+    # at batch size 1 the forward pass is dominated by per-kernel dispatch
+    # overhead; reduce-overhead mode captures a CUDA Graph that replays the
+    # whole forward with a single launch
+    eager = model
+    try:
+        if DEVICE.type == "cuda":
+            model = torch.compile(eager, mode="reduce-overhead", fullgraph=True)
+        else:
+            model = torch.compile(eager)
+        # warm-up forward so compilation/graph capture happens here, not on
+        # the first real prediction; it must match the predict path exactly
+        # (channels_last strides, bf16 autocast) or dynamo's guards force a
+        # recompile on the first real batch. torch.compile itself is lazy,
+        # so backend failures (no Triton, no C compiler for Inductor) also
+        # surface here rather than on the first /classify
+        dummy = torch.zeros(1, 3, 224, 224, device=DEVICE).to(
+            memory_format=torch.channels_last)
+        with torch.no_grad():
+            with torch.autocast(device_type=DEVICE.type, dtype=torch.bfloat16):
+                model(dummy)
+    except Exception as e:
+        print(f"torch.compile unavailable, running eager: {e}")
+        model = eager
+
+    return model
+
+
+# (mtime_ns, parsed dict) for TRAINING_DATA_HASH_PATH; the file only changes
+# when create_working_model rewrites it, so a stat per call replaces a full
+# read+parse on the hot predict path
+_training_data_cache = (None, None)
+
+
+def _load_training_data():
+    global _training_data_cache
+    mtime_ns = os.stat(TRAINING_DATA_HASH_PATH).st_mtime_ns
+    if _training_data_cache[0] != mtime_ns:
+        with open(TRAINING_DATA_HASH_PATH, "r") as f:
+            _training_data_cache = (mtime_ns, json.load(f))
+    return _training_data_cache[1]
+
+
+def _load_categories():
+    """
+    Returns the category list for the current working model, raising if
+    create_working_model has not been run yet.
+    """
+    if not os.path.exists(TRAINING_DATA_HASH_PATH):
+        raise FileNotFoundError("Hashed training data file not found. Please run create_working_model first.")
+
+    data = _load_training_data()
+    categories = data.get("categories", [])
+    if not categories:
+        raise ValueError("No categories found in training data hash.")
+    return categories
+
+
+def _export_onnx(model):
+    """
+    Exports the trained model for ONNX Runtime. The export applies constant
+    folding, conv+bn fusion and layout optimization ahead of time, and the
+    runtime serves the graph without per-op Python dispatch.
+    """
+    try:
+        model.eval()
+        dummy = torch.zeros(1, 3, 224, 224, device=DEVICE)
+        torch.onnx.export(
+            model, dummy, MODEL_ONNX_PATH,
+            input_names=["x"], output_names=["logits"],
+            dynamic_axes={"x": {0: "N"}, "logits": {0: "N"}},
+            opset_version=17,
+        )
+        _get_ort_session.cache_clear()
+    except Exception as e:
+        print(f"ONNX export skipped: {e}")
+
+
+@lru_cache(maxsize=2)
+def _get_ort_session(onnx_mtime_ns):
+    providers = ["CPUExecutionProvider"]
+    if DEVICE.type == "cuda":
+        providers.insert(0, "CUDAExecutionProvider")
+    return ort.InferenceSession(MODEL_ONNX_PATH, providers=providers)
+
+
+def _ort_logits(batch):
+    """
+    Runs the batch through the exported ONNX model when onnxruntime is
+    installed and the export is at least as fresh as the saved weights.
+    Returns the logits as a CPU tensor, or None to fall back to PyTorch.
+    """
+    if ort is None:
+        return None
+    try:
+        # a missing export is expected (export failed or hasn't happened
+        # yet), not a failure worth logging on every call
+        try:
+            onnx_mtime_ns = os.stat(MODEL_ONNX_PATH).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if onnx_mtime_ns < os.stat(MODEL_PATH).st_mtime_ns:
+            return None
+        session = _get_ort_session(onnx_mtime_ns)
+        outputs = session.run(None, {"x": batch.numpy()})
+        return torch.from_numpy(outputs[0])
+    except Exception as e:
+        print(f"ONNX Runtime inference failed, falling back to PyTorch: {e}")
+        return None
+
+
+def _preprocess(image_data):
+    """Turns one base64 string / raw bytes / file path into a (3, 224, 224) tensor."""
+    return test_transforms(process_image_input(image_data))
+
+
+def predict(image_data):
+    """
+    Predict the category scores for a given image.
+    Accepts image_data which can be a base64 string, raw bytes, or a valid file path.
+    Uses the cached model for MODEL_PATH, processes the image, and returns a dictionary
+    mapping each category to a score (0–100).
+    """
+    return predict_batch([image_data])[0]
+
+
+def predict_batch(image_data_list):
+    """
+    Predict category scores for several images in one forward pass; batching
+    amortizes the per-call dispatch overhead that dominates at batch size 1.
+    Returns a list of score dictionaries in input order.
+    """
+    categories = _load_categories()
+
+    batch = torch.stack([_preprocess(image_data) for image_data in image_data_list])
+
+    logits = _ort_logits(batch)
+    if logits is not None:
+        probs = torch.softmax(logits, dim=1).numpy()
+    else:
+        model = _get_model(tuple(categories), os.stat(MODEL_PATH).st_mtime_ns)
+        batch = batch.to(DEVICE, memory_format=torch.channels_last)
+        with torch.no_grad():
+            with torch.autocast(device_type=DEVICE.type, dtype=torch.bfloat16):
+                outputs = model(batch)
+            # .float() since numpy has no bfloat16
+            probs = torch.softmax(outputs.float(), dim=1).cpu().numpy()
+
+    return [{category: round(prob * 100, 2) for category, prob in zip(categories, row)}
+            for row in probs]
 
 
 if __name__ == "__main__":
@@ -301,10 +662,9 @@ if __name__ == "__main__":
     # test the model_manager functions with sample images
 
     import sys
-    load_dotenv()
     num_images = 8
 
-    sample_dir = os.getenv("SAMPLE_DIR")
+    sample_dir = SAMPLE_DIR
     if sample_dir is None:
         print("WORKING_DIR environment variable is not set.")
         sys.exit(1)
@@ -324,10 +684,10 @@ if __name__ == "__main__":
 
     create_working_model(sample_dir)
 
-    for file_name in first_three_files:
-        image_path = os.path.join(input_folder, file_name)
-        print(f"\nRunning prediction for image: {file_name}")
-        scores = predict(image_path)
-        print("Prediction scores:")
+    image_paths = [os.path.join(input_folder, file_name) for file_name in first_three_files]
+    all_scores = predict_batch(image_paths)
+
+    for file_name, scores in zip(first_three_files, all_scores):
+        print(f"\nPrediction scores for image: {file_name}")
         for category, score in scores.items():
             print(f"  {category}: {score}%")
@@ -24,9 +24,9 @@ export default function ActionHistory({ actionHistory }) {
                 className="flex-shrink-0 mr-4"
                 style={{ width: "80px", height: "80px" }}
               >
-                {action.image_data && action.mime_type ? (
+                {action.image_url ? (
                   <img
-                    src={`data:${action.mime_type};base64,${action.image_data}`}
+                    src={action.image_url}
                     alt={action.image_name || "Untitled"}
                     className="w-full h-full object-contain"
                   />
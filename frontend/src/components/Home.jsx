@@ -9,7 +9,7 @@ export default function Home() {
   // ================ State variables ================
   const [backendUrl, setBackendUrl] = useState('');
   const [userToken, setUserToken] = useState(null);
-  const [image, setImage] = useState(null); // { image_name, image_data, mime_type }
+  const [image, setImage] = useState(null); // { image_name, image_url }
   const [actionHistory, setActionHistory] = useState([]); 
   const [folders, setFolders] = useState([]); // each folder: { name, is_empty, has_pending, can_delete, prediction }
   const [error, setError] = useState(null);
@@ -192,11 +192,16 @@ export default function Home() {
         const err = await res.json().catch(() => ({}));
         throw new Error(err.error || 'No image found in input folder');
       }
-      const data = await res.json();
-      setImage(data);
-      console.log('Fetched image:', data.image_name);
+      const imageName = res.headers.get('X-Image-Name');
+      const blob = await res.blob();
+      const imageUrl = URL.createObjectURL(blob);
+      setImage((prev) => {
+        if (prev && prev.image_url) URL.revokeObjectURL(prev.image_url);
+        return { image_name: imageName, image_url: imageUrl };
+      });
+      console.log('Fetched image:', imageName);
       appendLog('Fetched image');
-      classifyImage(data.image_name);
+      classifyImage(imageName);
     } catch (err) {
       console.error(err);
       appendLog('Error fetching image');
@@ -259,8 +264,12 @@ export default function Home() {
         throw new Error('Error fetching stack');
       }
       const data = await res.json();
-      setActionHistory(data.stack);
-      console.log('Action history updated:', data.stack);
+      const actions = data.stack.map((action) => ({
+        ...action,
+        image_url: `${backendUrl}${action.preview_url}?token=${userToken}`
+      }));
+      setActionHistory(actions);
+      console.log('Action history updated:', actions);
       appendLog('Action history updated');
     } catch (err) {
       console.error(err);
@@ -321,7 +330,11 @@ export default function Home() {
       }
       console.log(`Pending action: ${image.image_name} -> ${folderName}`);
       appendLog(`New pending action`);
-      const newAction = { ...image, target_folder: folderName };
+      const newAction = {
+        image_name: image.image_name,
+        target_folder: folderName,
+        image_url: `${backendUrl}/image/raw/${encodeURIComponent(image.image_name)}?token=${userToken}`
+      };
       setActionHistory((prev) => [...prev, newAction]);
       fetchImage();    
       fetchFolders();
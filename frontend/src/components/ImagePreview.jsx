@@ -49,7 +49,7 @@ export default function ImagePreview({ image }) {
       >
         {image ? (
           <img
-            src={`data:${image.mime_type};base64,${image.image_data}`}
+            src={image.image_url}
             alt={image.image_name}
             className="object-contain w-full h-full"
           />